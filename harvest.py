@@ -3,20 +3,26 @@ AOM Harvester (HTML + ICS) with strict timeouts and fast-fail behavior.
 
 - Never hangs: all network calls use short timeouts + tiny retry.
 - Always writes a JSON artifact: aom-events.json
-- Inputs via env: KEYWORDS, CITY, STATE, COUNTRY, WITHIN_MILES, WINDOW_DAYS, ICS_FEEDS
+- Inputs via env: KEYWORDS, CITY, STATE, COUNTRY, WITHIN_MILES, WINDOW_DAYS, ICS_FEEDS,
+  FEED_CONCURRENCY
 """
 
 from __future__ import annotations
-import os, sys, json, time, re
-from datetime import datetime, timedelta, timezone
-from urllib.parse import urlencode
-from typing import List, Dict, Any
+import hashlib, io, os, sys, json, threading, time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
 
 # --- Tunables ---------------------------------------------------------------
 REQ_TIMEOUT = 12         # seconds per HTTP request (hard limit)
 REQ_RETRIES = 1          # minimal retry so we fail fast but not flaky
 GLOBAL_SOFT_TIME = 240   # seconds soft budget for the whole run (job has 5m hard timeout)
+ICS_WORKERS = 8          # default max feeds downloaded concurrently (FEED_CONCURRENCY)
 USER_AGENT = "AOMHarvester/1.0 (+github actions)"
+ICS_CACHE_DIR = ".cache/ics"  # ETag/Last-Modified + last body per feed (persisted by actions/cache)
+ICS_EVENTS_CACHE_VERSION = 2  # bump whenever the event dict shape/derivation changes
 
 # ---------------------------------------------------------------------------
 
@@ -38,73 +44,338 @@ def split_list(s: str) -> List[str]:
     if not s:
         return []
     # split by commas or newlines, trim blanks
-    parts = re.split(r"[,\n]+", s)
-    return [p.strip() for p in parts if p.strip()]
+    return [p.strip() for p in s.replace("\n", ",").split(",") if p.strip()]
 
-# --- Safe HTTP fetch with timeout + tiny retry -----------------------------
-def http_get(url: str) -> tuple[int, str] | tuple[None, None]:
-    import requests
-    headers = {"User-Agent": USER_AGENT, "Accept": "*/*"}
-    last_exc = None
-    for attempt in range(REQ_RETRIES + 1):
+def unique_urls(urls: Iterable[str]) -> List[str]:
+    """Drop URLs that only differ by scheme/host case, a trailing slash or a #fragment.
+
+    The first spelling is kept and fetched as given; this only stops the same feed
+    from being downloaded and parsed twice in one run.
+    """
+    seen = set()
+    out = []
+    for u in urls:
         try:
-            r = requests.get(url, headers=headers, timeout=REQ_TIMEOUT)
-            return r.status_code, r.text
-        except Exception as e:
-            last_exc = e
-            time.sleep(0.5)
-    # failed
-    return None, None
+            p = urlsplit(u)
+            # Only host[:port] is case-insensitive; any user:password@ part is not
+            userinfo, _, hostport = p.netloc.rpartition("@")
+            key = (p.scheme.lower(), userinfo, hostport.lower(), p.path.rstrip("/"), p.query)
+        except ValueError:
+            # e.g. an unbalanced "[" in the host; keep it and let the fetch fail later
+            key = u
+        if key not in seen:
+            seen.add(key)
+            out.append(u)
+    return out
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Run inputs, read from the environment once and passed around from there."""
+    keywords: Tuple[str, ...] = ()
+    city: str = ""
+    state: str = ""
+    country: str = ""
+    within_miles: Optional[int] = None  # not used yet, reserved
+    window_days: int = 180
+    ics_feeds: Tuple[str, ...] = ()
+    feed_concurrency: int = ICS_WORKERS
+
+    @classmethod
+    def from_env(cls) -> "Config":
+        within = env_str("WITHIN_MILES")
+        return cls(
+            keywords=tuple(split_list(env_str("KEYWORDS", "steampunk,victorian,renaissance,faire,aether,tesla,edison"))),
+            city=env_str("CITY"),
+            state=env_str("STATE"),
+            country=env_str("COUNTRY"),
+            within_miles=int(within) if within.isdigit() else None,
+            window_days=env_int("WINDOW_DAYS", 180),
+            ics_feeds=tuple(unique_urls(split_list(env_str("ICS_FEEDS")))),
+            feed_concurrency=max(1, env_int("FEED_CONCURRENCY", ICS_WORKERS)),
+        )
+
+# --- Safe HTTP fetch with timeout + tiny retry -----------------------------
+_SESSION = None  # shared keep-alive pool, built lazily so a missing `requests` can't kill the run
+_SESSION_LOCK = threading.Lock()  # feed workers may race to build it
+
+def http_session():
+    """Return the process-wide pooled session (TCP/TLS reused across fetches)."""
+    global _SESSION
+    if _SESSION is not None:
+        return _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is not None:
+            return _SESSION
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        s = requests.Session()
+        s.headers.update({"User-Agent": USER_AGENT, "Accept": "*/*"})
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=16,
+            max_retries=Retry(
+                total=REQ_RETRIES,
+                backoff_factor=0.3,
+                status_forcelist=(429, 500, 502, 503, 504),
+                # Retry-After can ask for minutes/hours; only our short backoff applies
+                respect_retry_after_header=False,
+                raise_on_status=False,
+            ),
+        )
+        s.mount("https://", adapter)
+        s.mount("http://", adapter)
+        _SESSION = s
+    return _SESSION
+
+def http_get(url: str, headers: Optional[Dict[str, str]] = None):
+    """GET via the pooled session; the response, or None on any network failure."""
+    try:
+        return http_session().get(url, headers=headers, timeout=REQ_TIMEOUT)
+    except Exception:
+        # failed (retries are handled by the adapter)
+        return None
 
 # --- ICS ingestion ----------------------------------------------------------
-def parse_ics_feed(url: str, window_days: int) -> List[Dict[str, Any]]:
-    """Parse a single ICS feed URL into our normalized event dicts."""
-    from ics import Calendar
-    events: List[Dict[str, Any]] = []
-    code, text = http_get(url)
-    if code is None or not text:
-        return events
+def _ics_cache_paths(url: str) -> Tuple[str, str, str]:
+    """(body, validators, parsed events) cache files for one feed URL."""
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    base = os.path.join(ICS_CACHE_DIR, key)
+    return base + ".ics", base + ".meta.json", base + ".events.json"
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _fetch_ics(url: str) -> Optional[bytes]:
+    """Download one ICS feed as raw bytes; None on network error, error status or empty body.
 
+    Sends If-None-Match/If-Modified-Since from the last successful fetch; on a
+    304 the cached body is reused, so unchanged feeds cost a headers-only round trip.
+    """
+    body_path, meta_path, _ = _ics_cache_paths(url)
+    validators: Dict[str, str] = {}
     try:
-        cal = Calendar(text)
+        with open(meta_path, encoding="utf-8") as f:
+            validators = json.load(f)
     except Exception:
-        return events
+        pass
+    headers = {}
+    if validators and os.path.exists(body_path):
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
 
-    cutoff_end = now_utc() + timedelta(days=window_days)
-    cutoff_start = now_utc() - timedelta(days=1)
+    r = http_get(url, headers=headers)
+    if r is None:
+        return None
 
-    def to_iso(dt):
-        if dt is None:
+    if r.status_code == 304 and headers:
+        try:
+            with open(body_path, "rb") as f:
+                return f.read() or None
+        except OSError:
             return None
-        if getattr(dt, "tzinfo", None) is None:
-            # assume UTC if naive
-            return dt.replace(tzinfo=timezone.utc).isoformat()
-        return dt.astimezone(timezone.utc).isoformat()
+    # Retries don't raise on exhausted statuses, so 404/5xx error pages land here too
+    if r.status_code != 200:
+        return None
+
+    # Raw bytes: no charset guessing/decoding of the whole body (ICS is UTF-8 per RFC 5545)
+    body = r.content
+    if not body:
+        return None
+    if r.headers.get("ETag") or r.headers.get("Last-Modified"):
+        # Cache is best-effort; a read-only or full disk must not fail the fetch.
+        try:
+            os.makedirs(ICS_CACHE_DIR, exist_ok=True)
+            _write_atomic(body_path, body)
+            _write_atomic(meta_path, json.dumps({
+                "url": url,
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+            }).encode("utf-8"))
+        except OSError:
+            pass
+    return body
+
+def prune_ics_cache(urls: Iterable[str]) -> None:
+    """Remove cache files of feeds no longer listed in ICS_FEEDS (best effort)."""
+    keep = {os.path.basename(_ics_cache_paths(u)[0]).split(".", 1)[0] for u in urls}
+    try:
+        names = os.listdir(ICS_CACHE_DIR)
+    except OSError:
+        return
+    for name in names:
+        if name.split(".", 1)[0] not in keep:
+            try:
+                os.remove(os.path.join(ICS_CACHE_DIR, name))
+            except OSError:
+                pass
+
+def iter_ics_downloads(urls: List[str], deadline: float, workers: int = ICS_WORKERS) -> Iterator[Tuple[str, Future]]:
+    """Download feeds concurrently, yielding (url, future) as each one finishes.
+
+    I/O-bound, so wall time ~ slowest feed, and the caller can parse early arrivals
+    while the rest are in flight. Raises TimeoutError once the soft deadline passes.
+    """
+    if not urls:
+        return
+    pool = ThreadPoolExecutor(max_workers=min(workers, len(urls)))
+    futures = {pool.submit(_fetch_ics, url): url for url in urls}
+    try:
+        for fut in as_completed(futures, timeout=max(0.0, deadline - time.time())):
+            yield futures[fut], fut
+    finally:
+        # Lets main() finish its work past the deadline; queued feeds are dropped.
+        # Running downloads are not interrupted: the interpreter still joins their
+        # threads at exit. REQ_TIMEOUT bounds each socket operation, not the whole
+        # request, and (REQ_RETRIES + 1) attempts plus backoff can add up.
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _iter_ics_blocks(data: bytes) -> Iterator[Tuple[bytes, bytes]]:
+    """Yield (name, raw block) for each top-level VTIMEZONE/VEVENT.
+
+    Only one component is ever parsed/held at a time.
+    """
+    name: Optional[bytes] = None
+    buf: List[bytes] = []
+    for line in io.BytesIO(data):
+        line = line.rstrip(b"\r\n")
+        tag = line.strip().upper()
+        if name is None:
+            if tag in (b"BEGIN:VEVENT", b"BEGIN:VTIMEZONE"):
+                name, buf = tag[6:], [line]
+            continue
+        buf.append(line)
+        if tag == b"END:" + name:
+            yield name, b"\r\n".join(buf)
+            name, buf = None, []
+
+def _ics_dt(prop, tzmap: Optional[Dict[str, Any]] = None) -> Optional[datetime]:
+    """DTSTART/DTEND property -> aware UTC-comparable datetime (dates become midnight UTC).
+
+    A TZID defined by the feed's own VTIMEZONE (see `tzmap`) wins over whatever
+    icalendar resolved it to, since its global registry keeps the first definition seen.
+    """
+    if prop is None:
+        return None
+    dt = prop.dt
+    tz = tzmap.get(str(prop.params.get("TZID"))) if tzmap and "TZID" in prop.params else None
+    if tz is not None and isinstance(dt, datetime):
+        # Re-attach the wall-clock time as written to the feed's own zone
+        return dt.replace(tzinfo=None).replace(tzinfo=tz)
+    # Common case first: an aware datetime needs no coercion at all
+    if getattr(dt, "tzinfo", None) is not None:
+        return dt
+    if isinstance(dt, datetime):
+        # assume UTC if naive
+        return dt.replace(tzinfo=timezone.utc)
+    if isinstance(dt, date):
+        return datetime(dt.year, dt.month, dt.day, tzinfo=timezone.utc)
+    return None
+
+def _ics_text(value) -> Optional[str]:
+    return str(value) if value is not None else None
+
+# Text properties we copy out of each VEVENT, in output order.
+_ICS_TEXT_FIELDS = ("SUMMARY", "DESCRIPTION", "LOCATION", "UID")
+
+def to_iso(dt: Optional[datetime]) -> Optional[str]:
+    if dt is None:
+        return None
+    if dt.tzinfo is timezone.utc:
+        return dt.isoformat()
+    return dt.astimezone(timezone.utc).isoformat()
+
+def _iter_ics_rows(url: str, data: bytes, cs: float, ce: Optional[float]) -> Iterator[Tuple[Optional[float], Dict[str, Any]]]:
+    """Yield (start timestamp, event dict) for events starting in [cs, ce].
+
+    Bounds are POSIX floats (compared instead of tz-aware datetimes); ce=None
+    leaves the window open-ended. Undated events are always kept.
+    """
+    from icalendar import Event, Timezone
+    tzmap: Dict[str, Any] = {}  # this feed's own VTIMEZONE definitions, by TZID
+    for name, block in _iter_ics_blocks(data):
+        if name == b"VTIMEZONE":
+            try:
+                vtz = Timezone.from_ical(block)
+                tzmap[vtz.tz_name] = vtz.to_tz(lookup_tzid=False)
+            except Exception:
+                pass
+            continue
+        try:
+            ev = Event.from_ical(block)
+        except Exception:
+            continue
 
-    for ev in cal.events:
         # Some ICS have no times; guard it
         try:
-            start = ev.begin.datetime if hasattr(ev, "begin") else None
-            end   = ev.end.datetime   if hasattr(ev, "end")   else None
+            dtstart = ev.get("DTSTART")
+            start = _ics_dt(dtstart, tzmap)
+            end   = _ics_dt(ev.get("DTEND"), tzmap)
+            if end is None and start is not None:
+                # RFC 5545 3.6.1: DURATION, else one day for dates, else an instant
+                if "DURATION" in ev:
+                    end = start + ev["DURATION"].dt
+                elif not isinstance(dtstart.dt, datetime):
+                    end = start + timedelta(days=1)
+                else:
+                    end = start
         except Exception:
-            start = end = None
+            dtstart = start = end = None
 
         # Window filter (if dates exist)
-        if start and (start < cutoff_start or start > cutoff_end):
-            continue
+        ts = None
+        if start is not None:
+            ts = start.timestamp()
+            if ts < cs or (ce is not None and ts > ce):
+                continue
 
-        events.append({
+        # Only events that survive the window pay for the text lookups
+        title, desc, loc, uid = map(_ics_text, map(ev.get, _ICS_TEXT_FIELDS))
+        yield ts, {
             "source": "ics",
             "source_url": url,
-            "title": getattr(ev, "name", None),
-            "description": getattr(ev, "description", None),
+            "title": title,
+            "description": desc,
             "start": to_iso(start),
             "end": to_iso(end),
-            "location": getattr(ev, "location", None),
-            "all_day": bool(getattr(ev, "all_day", False)),
-            "uid": getattr(ev, "uid", None),
-        })
-    return events
+            "location": loc,
+            "all_day": dtstart is not None and not isinstance(dtstart.dt, datetime),
+            "uid": uid,
+        }
+
+def cached_ics_events(url: str, data: bytes, cutoff_start: datetime, cutoff_end: datetime) -> List[Dict[str, Any]]:
+    """Normalized events starting in [cutoff_start, cutoff_end] from a raw ICS body.
+
+    Memoised on disk by body hash so unchanged feeds skip the parse. The cache keeps
+    every event from cutoff_start onwards (no upper bound), so it stays valid on
+    later runs as the window slides forward.
+    """
+    cs, ce = cutoff_start.timestamp(), cutoff_end.timestamp()
+    digest = hashlib.sha256(data).hexdigest()
+    path = _ics_cache_paths(url)[2]
+    rows = None
+    try:
+        with open(path, encoding="utf-8") as f:
+            cached = json.load(f)
+        if (cached.get("version") == ICS_EVENTS_CACHE_VERSION and cached.get("sha256") == digest
+                and cached.get("cutoff_start", cs + 1) <= cs):
+            rows = cached["rows"]
+    except Exception:
+        pass
+    if rows is None:
+        rows = [[ts, ev] for ts, ev in _iter_ics_rows(url, data, cs, None)]
+        try:
+            os.makedirs(ICS_CACHE_DIR, exist_ok=True)
+            _write_atomic(path, json.dumps({"version": ICS_EVENTS_CACHE_VERSION, "sha256": digest,
+                                            "cutoff_start": cs, "rows": rows}, ensure_ascii=False).encode("utf-8"))
+        except OSError:
+            pass
+    return [ev for ts, ev in rows if ts is None or cs <= ts <= ce]
 
 # --- Extremely conservative HTML “searchers” (non-blocking) ----------------
 # These are placeholders that return quickly with timeouts;
@@ -116,43 +387,75 @@ def html_search_eventbrite(keyword: str, city: str, state: str, country: str) ->
 def html_search_tickettailor(keyword: str, city: str, state: str, country: str) -> List[Dict[str, Any]]:
     return []
 
-# --- Main -------------------------------------------------------------------
-def main():
-    soft_deadline = time.time() + GLOBAL_SOFT_TIME
+# --- Dedup -----------------------------------------------------------------
+def dedupe_key(ev: Dict[str, Any]) -> Tuple[Any, Any]:
+    """Events are the same if (title, start) match."""
+    return ev.get("title"), ev.get("start")
 
-    keywords = split_list(env_str("KEYWORDS", "steampunk,victorian,renaissance,faire,aether,tesla,edison"))
-    city     = env_str("CITY")
-    state    = env_str("STATE")
-    country  = env_str("COUNTRY")
-    within   = env_str("WITHIN_MILES")  # not used yet, reserved
-    window_days = env_int("WINDOW_DAYS", 180)
+# --- Output ----------------------------------------------------------------
+def write_json(path: str, payload: Dict[str, Any]) -> None:
+    """Write pretty-printed UTF-8 JSON, via orjson when it is installed."""
+    try:
+        import orjson
+        data = orjson.dumps(payload, option=orjson.OPT_INDENT_2)
+    except ImportError:
+        data = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(data)
 
-    ics_feeds = split_list(env_str("ICS_FEEDS"))
+# --- Main -------------------------------------------------------------------
+def main(cfg: Optional[Config] = None):
+    soft_deadline = time.time() + GLOBAL_SOFT_TIME
+    cfg = cfg or Config.from_env()
+    now = now_utc()  # one clock read: stamps the run and anchors the ICS window
 
     meta: Dict[str, Any] = {
-        "ts_utc": now_utc().isoformat(),
-        "keywords": keywords,
-        "city": city or None,
-        "state": state or None,
-        "country": country or None,
-        "within_miles": int(within) if within.isdigit() else None,
-        "window_days": window_days,
-        "sources": ["ics" if ics_feeds else None, "eventbrite_html", "tickettailor_html"],
+        "ts_utc": now.isoformat(),
+        "keywords": list(cfg.keywords),
+        "city": cfg.city or None,
+        "state": cfg.state or None,
+        "country": cfg.country or None,
+        "within_miles": cfg.within_miles,
+        "window_days": cfg.window_days,
+        "sources": ["ics" if cfg.ics_feeds else None, "eventbrite_html", "tickettailor_html"],
     }
     # remove None entries from sources
     meta["sources"] = [s for s in meta["sources"] if s]
 
     out: Dict[str, Any] = {"meta": meta, "events": [], "notes": []}
 
-    # 1) ICS feeds (fast, reliable)
-    for url in ics_feeds:
-        if time.time() > soft_deadline:
-            out["notes"].append("Soft time budget exhausted during ICS fetch.")
-            break
-        try:
-            out["events"].extend(parse_ics_feed(url, window_days))
-        except Exception as e:
-            out["notes"].append(f"ICS error: {url} :: {type(e).__name__}")
+    # Deduped as collected (first occurrence wins)
+    events: Dict[Tuple[Any, Any], Dict[str, Any]] = {}
+    def collect(evs):
+        for ev in evs:
+            events.setdefault(dedupe_key(ev), ev)
+
+    # 1) ICS feeds (fast, reliable) -- fetched in parallel, parsed as each arrives
+    cutoff_start = now - timedelta(days=1)
+    cutoff_end = now + timedelta(days=cfg.window_days)
+    feeds = list(cfg.ics_feeds)
+    prune_ics_cache(feeds)
+    # Collected strictly in ICS_FEEDS order so the artifact doesn't depend on network
+    # timing; only feeds that finished ahead of an earlier, slower one wait in here.
+    ready: Dict[str, List[Dict[str, Any]]] = {}
+    nxt = 0
+    try:
+        for url, fut in iter_ics_downloads(feeds, soft_deadline, cfg.feed_concurrency):
+            ready[url] = []
+            try:
+                data = fut.result()
+                if data:
+                    ready[url] = cached_ics_events(url, data, cutoff_start, cutoff_end)
+            except Exception as e:
+                out["notes"].append(f"ICS error: {url} :: {type(e).__name__}")
+            while nxt < len(feeds) and feeds[nxt] in ready:
+                collect(ready.pop(feeds[nxt]))
+                nxt += 1
+    except TimeoutError:
+        out["notes"].append("Soft time budget exhausted during ICS fetch.")
+    # Past the deadline: keep whatever finished, still in feed order
+    for url in feeds[nxt:]:
+        collect(ready.pop(url, ()))
 
     # 2) Lightweight HTML attempts (kept super conservative; return quickly)
     def guard_time():
@@ -161,34 +464,24 @@ def main():
             return False
         return True
 
-    for kw in (keywords or []):
+    for kw in cfg.keywords:
         if not guard_time(): break
         try:
-            out["events"].extend(html_search_eventbrite(kw, city, state, country))
+            collect(html_search_eventbrite(kw, cfg.city, cfg.state, cfg.country))
         except Exception as e:
             out["notes"].append(f"eventbrite_html '{kw}' :: {type(e).__name__}")
 
         if not guard_time(): break
         try:
-            out["events"].extend(html_search_tickettailor(kw, city, state, country))
+            collect(html_search_tickettailor(kw, cfg.city, cfg.state, cfg.country))
         except Exception as e:
             out["notes"].append(f"tickettailor_html '{kw}' :: {type(e).__name__}")
 
-    # Deduplicate simple (by title+start)
-    seen = set()
-    unique = []
-    for ev in out["events"]:
-        key = (ev.get("title"), ev.get("start"))
-        if key in seen: 
-            continue
-        seen.add(key)
-        unique.append(ev)
-    out["events"] = unique
-    out["meta"]["count"] = len(unique)
+    out["events"] = list(events.values())
+    out["meta"]["count"] = len(events)
 
     # Always write the artifact
-    with open("aom-events.json", "w", encoding="utf-8") as f:
-        json.dump(out, f, ensure_ascii=False, indent=2)
+    write_json("aom-events.json", out)
 
     # Exit 0 so the workflow stays green but still uploads notes/errors
     return 0